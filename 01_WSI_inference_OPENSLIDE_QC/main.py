@@ -36,137 +36,180 @@ ENCODER_MODEL_WEIGHTS = 'imagenet'
 # CLASSES
 BACK_CLASS = 7
 
-parser = argparse.ArgumentParser()
-parser.add_argument('--slide_folder', dest='slide_folder', help='path to WSIs', type=str)
-parser.add_argument('--output_dir', dest='output_dir', help='path to output folder', type=str)
-parser.add_argument('--start', dest='start', default=0,  help='start num of WSIs', type=int)
-parser.add_argument('--end', dest='end', default=-1, help='end num of WSIs', type=int)
-parser.add_argument('--ol_factor', dest='ol_factor', default=10,
-                    help='reduction factor of the overlay compared to dimensions of original WSI', type=int)
-
-args = parser.parse_args()
-
-start = args.start
-end = args.end
-SLIDE_DIR = args.slide_folder
-OUTPUT_DIR = args.output_dir
-OVERLAY_FACTOR = args.ol_factor
-
-if end == -1:
-    end = len(os.listdir(SLIDE_DIR))
-
-case_name = os.path.basename(OUTPUT_DIR)
-REPORT_FILE_NAME = f'report_{case_name}_' + str(start) + '_' + str(end)     # File name, ".txt" will be added in the end
-REPORT_OUTPUT_DIR = OUTPUT_DIR # where to save the text report
-
-
-# =============================================================================
-# LOAD MODELS
-# =============================================================================
-model_prim = torch.load(MODEL_QC_DIR + MODEL_QC_NAME, map_location=DEVICE)
-
-# ====================================================================
-# PREPARE REPORT FILE, OUTPUT FOLDERS
-# =============================================================================
-
-# Prepare report file header
-path_result = os.path.join(REPORT_OUTPUT_DIR, REPORT_FILE_NAME + "_stats_per_slide.txt")
-output_header = "slide_name" + "\t" + "obj_power" + "\t" + "mpp" + "\t"
-output_header = output_header + "patch_n_h_l0" + "\t" + "patch_n_w_l0" + "\t"
-output_header = output_header + "patch_overall" + "\t"
-output_header = output_header + "height" + "\t" + "width" + "\t"
-output_header = output_header + "time"
-output_header = output_header + "\n"
-results = open(path_result, "a+")
-results.write(output_header)
-results.close()
-
-maps_dir = os.path.join(OUTPUT_DIR, 'maps_qc')
-overlay_dir = os.path.join(OUTPUT_DIR, 'overlays_qc')
-mask_dir = os.path.join(OUTPUT_DIR, 'mask_qc')
-
-try:
-    os.mkdir(maps_dir)
-    os.mkdir(overlay_dir)
-    os.mkdir(mask_dir)
-except Exception as e:
-    print('The target folders are already there ..')
-
-# ====================================================================
-# MAIN SCRIPT
-# =============================================================================
-
-# Read in slide names
-slide_names = sorted(os.listdir(SLIDE_DIR))
-# Start analysis loop
-
-for slide_name in slide_names[start:end]:
-    try:
-        # Register start time
-        start = timeit.default_timer()
-
-        print("")
-        print("Processing:", slide_name)
-
-        # Open slide
-        path_slide = os.path.join(SLIDE_DIR, slide_name)
-        slide = open_slide(path_slide)
-
-        # GET SLIDE INFO
-        p_s, patch_n_w_l0, patch_n_h_l0, mpp, w_l0, h_l0, obj_power = slide_info(slide, M_P_S_MODEL, MPP_MODEL)
-
-        # LOAD TISSUE DETECTION MAP
-        tis_det_map = Image.open(os.path.join(OUTPUT_DIR, 'tis_det_mask', slide_name + '_MASK.png'))
-        '''
-        Tissue detection map is generated on MPP = 10
-        This map is used for on-fly control of the necessity of model inference.
-        Two variants: reduced version with perfect correlation or full version scaled to working MPP of the tumor detection model
-        Classes: 0 - tissue, 1 - background
-        '''
-
-        tis_det_map_mpp = np.array(tis_det_map.resize((int(w_l0 * mpp / MPP_MODEL), int(h_l0 * mpp / MPP_MODEL)), Image.Resampling.LANCZOS))
-        map, full_mask = slide_process_single(model_prim, tis_det_map_mpp, slide, patch_n_w_l0, patch_n_h_l0, p_s,
-                                              M_P_S_MODEL, colors, ENCODER_MODEL,
-                                              ENCODER_MODEL_WEIGHTS, DEVICE, BACK_CLASS, MPP_MODEL, mpp, w_l0, h_l0)
-
-        # Timer stop
-        stop = timeit.default_timer()
-
-        map_path = os.path.join(maps_dir, slide_name + "_map_QC.png")
-        map.save(map_path)
-
-        mask_path = os.path.join(mask_dir, slide_name + "_mask.png")
-        cv2.imwrite(mask_path, full_mask)
+_model = None
+
+
+def load_model():
+    """
+    Load the artifact detection model once and keep it for later calls
+    """
+    global _model
+    if _model is None:
+        _model = torch.load(MODEL_QC_DIR + MODEL_QC_NAME, map_location=DEVICE)
+    return _model
+
+
+def run(slide_folder, output_dir, slides=None, start=0, end=-1, ol_factor=10, save_npy=False):
+    """
+    Run artifact detection on the slides of a folder
+
+    Args:
+        slide_folder (str): Path to WSIs
+        output_dir (str): Path to output folder, tissue detection has to be run on it first
+        slides (list): Slide file names to process, all files of slide_folder if None
+        start (int): Start num of WSIs
+        end (int): End num of WSIs, -1 for all
+        ol_factor (int): Reduction factor of the overlay compared to dimensions of original WSI
+        save_npy (bool): Additionally save the raw uint8 mask as .npy for fast analysis
+
+    Returns:
+        list: Names of the slides that were processed without error
+    """
+    SLIDE_DIR = slide_folder
+    OUTPUT_DIR = output_dir
+    OVERLAY_FACTOR = ol_factor
+    SAVE_NPY = save_npy
+
+    if slides is None:
+        slides = os.listdir(SLIDE_DIR)
+    if end == -1:
+        end = len(slides)
+
+    case_name = os.path.basename(OUTPUT_DIR)
+    REPORT_FILE_NAME = f'report_{case_name}_' + str(start) + '_' + str(end)     # File name, ".txt" will be added in the end
+    REPORT_OUTPUT_DIR = OUTPUT_DIR # where to save the text report
+
+    # =============================================================================
+    # LOAD MODELS
+    # =============================================================================
+    model_prim = load_model()
+
+    # ====================================================================
+    # PREPARE REPORT FILE, OUTPUT FOLDERS
+    # =============================================================================
+
+    # Prepare report file header
+    path_result = os.path.join(REPORT_OUTPUT_DIR, REPORT_FILE_NAME + "_stats_per_slide.txt")
+    output_header = "slide_name" + "\t" + "obj_power" + "\t" + "mpp" + "\t"
+    output_header = output_header + "patch_n_h_l0" + "\t" + "patch_n_w_l0" + "\t"
+    output_header = output_header + "patch_overall" + "\t"
+    output_header = output_header + "height" + "\t" + "width" + "\t"
+    output_header = output_header + "time"
+    output_header = output_header + "\n"
+    results = open(path_result, "a+")
+    results.write(output_header)
+    results.close()
+
+    maps_dir = os.path.join(OUTPUT_DIR, 'maps_qc')
+    overlay_dir = os.path.join(OUTPUT_DIR, 'overlays_qc')
+    mask_dir = os.path.join(OUTPUT_DIR, 'mask_qc')
 
-        del full_mask
-
-        # =============================================================================
-        # 8. MAKE AND SAVE OVERLAY for C8: HEATMAP ON REDUCED AND CROPPED SLIDE CLON
-        # =============================================================================
-        overlay = make_overlay(slide, map, p_s, patch_n_w_l0, patch_n_h_l0, OVERLAY_FACTOR)
-
-        del map
-
-        # Save overlaid image
-        overlay_im = Image.fromarray(overlay)
-        overlay_im_name = os.path.join(overlay_dir, slide_name + "_overlay_QC.jpg")
-        overlay_im.save(overlay_im_name)
-
-        del overlay
-
-        # Write down per slide result
-        # Basic data about slide (size, pixel size, objective power, height, width)
-        output_temp = slide_name + "\t" + str(obj_power) + "\t" + str(mpp) + "\t"
-        output_temp = output_temp + str(patch_n_h_l0) + "\t" + str(patch_n_w_l0) + "\t"
-        output_temp = output_temp + str(patch_n_h_l0 * patch_n_w_l0) + "\t"
-        output_temp = output_temp + str(patch_n_h_l0 * p_s) + "\t" + str(patch_n_w_l0 * p_s) + "\t"
-
-        output_temp = output_temp + str(round((stop - start) / 60, 1))
+    try:
+        os.mkdir(maps_dir)
+        os.mkdir(overlay_dir)
+        os.mkdir(mask_dir)
+    except Exception as e:
+        print('The target folders are already there ..')
 
-        output_temp = output_temp + "\n"
+    # ====================================================================
+    # MAIN SCRIPT
+    # =============================================================================
+
+    # Read in slide names
+    slide_names = sorted(slides)
+    # Start analysis loop
+
+    processed = []
+    for slide_name in slide_names[start:end]:
+        try:
+            # Register start time
+            start = timeit.default_timer()
+
+            print("")
+            print("Processing:", slide_name)
+
+            # Open slide
+            path_slide = os.path.join(SLIDE_DIR, slide_name)
+            slide = open_slide(path_slide)
+
+            # GET SLIDE INFO
+            p_s, patch_n_w_l0, patch_n_h_l0, mpp, w_l0, h_l0, obj_power = slide_info(slide, M_P_S_MODEL, MPP_MODEL)
+
+            # LOAD TISSUE DETECTION MAP
+            tis_det_map = Image.open(os.path.join(OUTPUT_DIR, 'tis_det_mask', slide_name + '_MASK.png'))
+            '''
+            Tissue detection map is generated on MPP = 10
+            This map is used for on-fly control of the necessity of model inference.
+            Two variants: reduced version with perfect correlation or full version scaled to working MPP of the tumor detection model
+            Classes: 0 - tissue, 1 - background
+            '''
+
+            tis_det_map_mpp = np.array(tis_det_map.resize((int(w_l0 * mpp / MPP_MODEL), int(h_l0 * mpp / MPP_MODEL)), Image.Resampling.LANCZOS))
+            map, full_mask = slide_process_single(model_prim, tis_det_map_mpp, slide, patch_n_w_l0, patch_n_h_l0, p_s,
+                                                  M_P_S_MODEL, colors, ENCODER_MODEL,
+                                                  ENCODER_MODEL_WEIGHTS, DEVICE, BACK_CLASS, MPP_MODEL, mpp, w_l0, h_l0)
+
+            # Timer stop
+            stop = timeit.default_timer()
+
+            map_path = os.path.join(maps_dir, slide_name + "_map_QC.png")
+            map.save(map_path)
+
+            mask_path = os.path.join(mask_dir, slide_name + "_mask.png")
+            cv2.imwrite(mask_path, full_mask)
+            if SAVE_NPY:
+                np.save(os.path.join(mask_dir, slide_name + "_mask.npy"), full_mask.astype(np.uint8, copy=False))
+
+            del full_mask
+
+            # =============================================================================
+            # 8. MAKE AND SAVE OVERLAY for C8: HEATMAP ON REDUCED AND CROPPED SLIDE CLON
+            # =============================================================================
+            overlay = make_overlay(slide, map, p_s, patch_n_w_l0, patch_n_h_l0, OVERLAY_FACTOR)
+
+            del map
+
+            # Save overlaid image
+            overlay_im = Image.fromarray(overlay)
+            overlay_im_name = os.path.join(overlay_dir, slide_name + "_overlay_QC.jpg")
+            overlay_im.save(overlay_im_name)
+
+            del overlay
+
+            # Write down per slide result
+            # Basic data about slide (size, pixel size, objective power, height, width)
+            output_temp = slide_name + "\t" + str(obj_power) + "\t" + str(mpp) + "\t"
+            output_temp = output_temp + str(patch_n_h_l0) + "\t" + str(patch_n_w_l0) + "\t"
+            output_temp = output_temp + str(patch_n_h_l0 * patch_n_w_l0) + "\t"
+            output_temp = output_temp + str(patch_n_h_l0 * p_s) + "\t" + str(patch_n_w_l0 * p_s) + "\t"
+
+            output_temp = output_temp + str(round((stop - start) / 60, 1))
+
+            output_temp = output_temp + "\n"
+
+            results = open(path_result, "a+")
+            results.write(output_temp)
+            results.close()
+        except Exception as e:
+            print(f"There was some problem with the slide. The error is: {e}")
+        else:
+            processed.append(slide_name)
+
+    return processed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--slide_folder', dest='slide_folder', help='path to WSIs', type=str)
+    parser.add_argument('--output_dir', dest='output_dir', help='path to output folder', type=str)
+    parser.add_argument('--start', dest='start', default=0,  help='start num of WSIs', type=int)
+    parser.add_argument('--end', dest='end', default=-1, help='end num of WSIs', type=int)
+    parser.add_argument('--ol_factor', dest='ol_factor', default=10,
+                        help='reduction factor of the overlay compared to dimensions of original WSI', type=int)
+    parser.add_argument('--save_npy', dest='save_npy', action='store_true',
+                        help='additionally save the raw uint8 mask as .npy for fast analysis')
+
+    args = parser.parse_args()
 
-        results = open(path_result, "a+")
-        results.write(output_temp)
-        results.close()
-    except Exception as e:
-        print(f"There was some problem with the slide. The error is: {e}")
+    run(args.slide_folder, args.output_dir, start=args.start, end=args.end,
+        ol_factor=args.ol_factor, save_npy=args.save_npy)
@@ -44,6 +44,8 @@ parser.add_argument('--start', dest='start', default=0, help='start num of WSIs'
 parser.add_argument('--end', dest='end', default=-1, help='end num of WSIs', type=int)
 parser.add_argument('--ol_factor', dest='ol_factor', default=10,
                     help='reduction factor of the overlay compared to dimensions of original WSI', type=int)
+parser.add_argument('--save_npy', dest='save_npy', action='store_true',
+                    help='additionally save the raw uint8 mask as .npy for fast analysis')
 
 args = parser.parse_args()
 
@@ -52,6 +54,7 @@ end = args.end
 SLIDE_DIR = args.slide_folder
 OUTPUT_DIR = args.output_dir
 OVERLAY_FACTOR = args.ol_factor
+SAVE_NPY = args.save_npy
 
 if end == -1:
     end = len(os.listdir(SLIDE_DIR))
@@ -140,6 +143,8 @@ for slide_name in slide_names[start:end]:
 
     mask_path = os.path.join(mask_dir, slide_name + "_mask.png")
     cv2.imwrite(mask_path, full_mask)
+    if SAVE_NPY:
+        np.save(os.path.join(mask_dir, slide_name + "_mask.npy"), full_mask.astype(np.uint8, copy=False))
 
     # =============================================================================
     # 8. MAKE AND SAVE OVERLAY for C8: HEATMAP ON REDUCED AND CROPPED SLIDE CLON
@@ -1,9 +1,35 @@
+from __future__ import annotations
+
 import os
+import importlib.util
 import numpy as np
 from PIL import Image
-import pandas as pd
-from typing import Dict, List, Tuple
-import matplotlib.pyplot as plt
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+# pandas and matplotlib are imported on first use so that analyzing masks
+# does not pay for loading them
+if TYPE_CHECKING:
+    import pandas as pd
+
+# numba is optional and imported on first use, see count_classes
+HAS_NUMBA = importlib.util.find_spec("numba") is not None
+
+
+def count_classes(mask: np.ndarray) -> np.ndarray:
+    """
+    Count the pixels of every class in a uint8 mask.
+    
+    Args:
+        mask: Mask array with class indices
+        
+    Returns:
+        Array of pixel counts indexed by class (at least 8 entries)
+    """
+    if HAS_NUMBA:
+        from hist_kernel import hist8
+        return hist8(np.ascontiguousarray(mask, dtype=np.uint8).ravel())
+    return np.bincount(mask.ravel(), minlength=8)
 
 class GrandQCAnalyzer:
     """
@@ -21,89 +47,161 @@ class GrandQCAnalyzer:
             7: "Background"
         }
         
-    def analyze_mask(self, mask_path: str) -> Dict[str, float]:
+        # Non-background classes in class order, computed once for the per-mask hot path
+        self._class_items = tuple((idx, name) for idx, name in self.artifact_classes.items() if idx != 7)
+        self._class_names = tuple(name for _, name in self._class_items)
+        self._class_indices = np.array([idx for idx, _ in self._class_items], dtype=np.intp)
+        
+    def _class_percentages(self, mask_path: str) -> np.ndarray:
         """
-        Analyze a single mask file and return percentage of each artifact type.
+        Calculate the percentage of each non-background class in a mask file.
+        
+        If a raw ``.npy`` mask (written by ``main.py --save_npy``) exists next
+        to the PNG and is not older than it, it is memory-mapped instead of
+        decoding the PNG.
         
         Args:
             mask_path: Path to the mask PNG file
             
         Returns:
-            Dictionary with artifact types and their percentages
+            float32 array with the percentages of classes 1-6, in class order
         """
-        # Read the mask
-        mask = np.array(Image.open(mask_path))
+        # Skip a stale .npy left over from an earlier run that rewrote only the PNG
+        npy_path = os.path.splitext(mask_path)[0] + ".npy"
+        if os.path.exists(npy_path) and os.path.getmtime(npy_path) >= os.path.getmtime(mask_path):
+            mask = np.load(npy_path, mmap_mode="r")
+        else:
+            # Read the mask as uint8 and close the file as soon as it is decoded
+            with Image.open(mask_path) as img:
+                if img.mode not in ("L", "P"):
+                    img = img.convert("L")
+                mask = np.asarray(img, dtype=np.uint8)
+        
+        # Count every class in a single pass
+        counts = count_classes(mask)
+        class_counts = counts[self._class_indices]
         
-        # Get total non-background pixels (class 7 is background)
-        total_tissue_pixels = np.sum(mask != 7)
+        # Get total tissue pixels (class 0 is padding, class 7 is background)
+        total_tissue_pixels = class_counts.sum()
         
         if total_tissue_pixels == 0:
-            return {self.artifact_classes[i]: 0.0 for i in range(1, 7)}
+            return np.zeros(len(class_counts), dtype=np.float32)
+            
+        # Left unrounded, values are formatted to two decimals only on output
+        return (class_counts * (100.0 / total_tissue_pixels)).astype(np.float32)
+    
+    def analyze_mask(self, mask_path: str) -> Dict[str, float]:
+        """
+        Analyze a single mask file and return percentage of each artifact type.
+        
+        Args:
+            mask_path: Path to the mask PNG file
             
-        # Calculate percentages for each class
-        percentages = {}
-        for class_idx, class_name in self.artifact_classes.items():
-            if class_idx != 7:  # Skip background
-                pixels = np.sum(mask == class_idx)
-                percentage = (pixels / total_tissue_pixels) * 100
-                percentages[class_name] = round(percentage, 2)
-                
-        return percentages
+        Returns:
+            Dictionary with artifact types and their percentages
+        """
+        percentages = self._class_percentages(mask_path).tolist()
+        return {name: round(pct, 2) for name, pct in zip(self._class_names, percentages)}
     
-    def analyze_directory(self, mask_dir: str) -> pd.DataFrame:
+    def analyze_directory(self, mask_dir: str, max_workers: Optional[int] = None,
+                          use_threads: bool = False) -> pd.DataFrame:
         """
         Analyze all mask files in a directory.
         
         Args:
             mask_dir: Directory containing mask PNG files
+            max_workers: Number of parallel workers (defaults to the CPU count)
+            use_threads: Use a thread pool instead of a process pool
             
         Returns:
             DataFrame with analysis results for all slides
         """
-        results = []
-        
-        # Process each mask file
-        for filename in os.listdir(mask_dir):
-            if filename.endswith("_mask.png"):
-                mask_path = os.path.join(mask_dir, filename)
-                percentages = self.analyze_mask(mask_path)
-                
-                # Add filename to results
-                result_row = {"Slide": filename.replace("_mask.png", "")}
-                result_row.update(percentages)
-                results.append(result_row)
-                
-        # Convert to DataFrame
-        return pd.DataFrame(results)
+        import pandas as pd
+        
+        filenames = []
+        mask_paths = []
+        with os.scandir(mask_dir) as entries:
+            for entry in entries:
+                if entry.name.endswith("_mask.png") and entry.is_file():
+                    filenames.append(entry.name)
+                    mask_paths.append(entry.path)
+        
+        # One row per slide, one column per artifact class (background skipped)
+        table = np.empty((len(mask_paths), len(self._class_names)), dtype=np.float32)
+        
+        # Process the mask files in parallel, results keep the input order
+        executor_cls = ThreadPoolExecutor if use_threads else ProcessPoolExecutor
+        with executor_cls(max_workers=max_workers) as executor:
+            for i, row in enumerate(executor.map(self._class_percentages, mask_paths, chunksize=8)):
+                table[i] = row
+        
+        # Build the DataFrame once from the column arrays
+        slides = [filename.replace("_mask.png", "") for filename in filenames]
+        columns = {class_name: table[:, j] for j, class_name in enumerate(self._class_names)}
+        return pd.DataFrame({"Slide": slides, **columns})
     
-    def generate_report(self, df: pd.DataFrame, output_dir: str):
+    def generate_report(self, df: pd.DataFrame, output_dir: str, as_csv: bool = False,
+                        plot_format: str = "png"):
         """
         Generate analysis report with visualizations.
         
         Args:
             df: DataFrame with analysis results
             output_dir: Directory to save report files
+            as_csv: Save the tables as CSV instead of Parquet (also used when
+                pyarrow is not installed)
+            plot_format: Image format of the distribution plot ("svg" skips rasterizing)
         """
+        import pandas as pd
+        from matplotlib.figure import Figure
+        
         # Create output directory if it doesn't exist
         os.makedirs(output_dir, exist_ok=True)
         
-        # Save detailed CSV report
-        df.to_csv(os.path.join(output_dir, "artifact_analysis.csv"), index=False)
-        
-        # Calculate summary statistics
-        summary = df.drop("Slide", axis=1).agg(['mean', 'std', 'min', 'max'])
-        summary.to_csv(os.path.join(output_dir, "summary_statistics.csv"))
-        
-        # Generate visualization
-        plt.figure(figsize=(12, 6))
-        box_data = [df[col] for col in df.columns if col != "Slide"]
-        plt.boxplot(box_data, labels=[col for col in df.columns if col != "Slide"])
-        plt.xticks(rotation=45)
-        plt.title("Distribution of Artifact Percentages Across Slides")
-        plt.ylabel("Percentage")
-        plt.tight_layout()
-        plt.savefig(os.path.join(output_dir, "artifact_distribution.png"))
-        plt.close()
+        # Calculate summary statistics on the numeric block in one go
+        columns = df.columns.drop("Slide")
+        arr = df[columns].to_numpy(dtype=np.float32)
+        if len(arr):
+            # Quartiles per column, the 0 and 1 quantiles double as min and max
+            q = np.quantile(arr, [0, .25, .5, .75, 1], axis=0)
+            # Sample std is undefined for a single slide, NaN as pandas reports it
+            std = arr.std(axis=0, ddof=1) if len(arr) > 1 else np.full(len(columns), np.nan, dtype=np.float32)
+            stats = np.stack([arr.mean(axis=0), std, q[0], q[4]])
+        else:
+            stats = np.full((4, len(columns)), np.nan, dtype=np.float32)
+        summary = pd.DataFrame(stats, index=['mean', 'std', 'min', 'max'], columns=columns)
+        
+        # Save detailed and summary reports
+        if not as_csv and importlib.util.find_spec("pyarrow") is None:
+            print("pyarrow is not installed, saving the report tables as CSV instead of Parquet")
+            as_csv = True
+        if as_csv:
+            df.to_csv(os.path.join(output_dir, "artifact_analysis.csv"), index=False, float_format="%.2f")
+            summary.to_csv(os.path.join(output_dir, "summary_statistics.csv"), float_format="%.2f")
+        else:
+            df.to_parquet(os.path.join(output_dir, "artifact_analysis.parquet"),
+                          engine="pyarrow", compression="zstd", index=False)
+            summary.to_parquet(os.path.join(output_dir, "summary_statistics.parquet"),
+                               engine="pyarrow", compression="zstd")
+        
+        if not len(arr):
+            print("No slides were analyzed, skipping the distribution plot")
+            return
+        
+        # Generate visualization (object-oriented API, no pyplot state)
+        fig = Figure(figsize=(12, 6))
+        ax = fig.subplots()
+        stats = [
+            {"label": col, "med": q[2, i], "q1": q[1, i], "q3": q[3, i],
+             "whislo": q[0, i], "whishi": q[4, i], "fliers": []}
+            for i, col in enumerate(columns)
+        ]
+        ax.bxp(stats, showfliers=False)
+        ax.tick_params(axis="x", labelrotation=45)
+        ax.set_title("Distribution of Artifact Percentages Across Slides")
+        ax.set_ylabel("Percentage")
+        fig.tight_layout()
+        fig.savefig(os.path.join(output_dir, f"artifact_distribution.{plot_format}"), format=plot_format)
 
 def main():
     # Example usage
@@ -0,0 +1,32 @@
+"""
+Numba histogram kernel for GrandQC masks.
+
+Kept in its own importable module so that numba's on-disk cache is keyed to a
+stable module name, and so that numba is only loaded when masks are counted.
+"""
+import numpy as np
+from numba import njit, types
+
+
+# Specialized for C-contiguous uint8 buffers, writable and read-only (PIL images
+# and memory-mapped masks are read-only), so no type inference runs at call time.
+SIGNATURES = [
+    types.int64[::1](types.Array(types.uint8, 1, 'C')),
+    types.int64[::1](types.Array(types.uint8, 1, 'C', readonly=True)),
+]
+
+
+# Serial on purpose: analyze_directory already runs one mask per pool worker,
+# and a parallel kernel would oversubscribe them (and is not thread safe under
+# numba's default workqueue layer). nogil lets thread pool workers count
+# concurrently. Compiled when this module is first imported and cached to disk.
+@njit(SIGNATURES, cache=True, nogil=True)
+def hist8(buf):
+    """
+    Histogram a flat uint8 buffer in one pass. The 256 bins cover every
+    uint8 value, so indexing can never go out of bounds.
+    """
+    counts = np.zeros(256, np.int64)
+    for i in range(buf.size):
+        counts[buf[i]] += 1
+    return counts
@@ -0,0 +1,176 @@
+import os
+import sys
+import warnings
+import importlib.util
+
+import numpy as np
+import pytest
+from PIL import Image
+
+# The analyzer is a script with a hyphenated file name, so load it from its path
+_spec = importlib.util.spec_from_file_location(
+    "artifact_analyzer", os.path.join(os.path.dirname(__file__), "artifact-analyzer.py"))
+artifact_analyzer = importlib.util.module_from_spec(_spec)
+# Registered so the process pool can pickle the analyzer's bound methods
+sys.modules["artifact_analyzer"] = artifact_analyzer
+_spec.loader.exec_module(artifact_analyzer)
+
+
+def make_mask():
+    # 40 tissue, 30 fold, 20 pen, 10 out of focus, 50 background, 50 padding pixels
+    values = [1] * 40 + [2] * 30 + [4] * 20 + [6] * 10 + [7] * 50 + [0] * 50
+    return np.array(values, dtype=np.uint8).reshape(10, 20)
+
+
+EXPECTED = {
+    "Normal Tissue": 40.0,
+    "Tissue Fold": 30.0,
+    "Dark Spot/Foreign": 0.0,
+    "Pen Marking": 20.0,
+    "Air Bubble/Edge": 0.0,
+    "Out of Focus": 10.0,
+}
+
+
+@pytest.fixture(params=["numba", "bincount"])
+def counting(request, monkeypatch):
+    """Run a test once with the Numba kernel and once with the np.bincount fallback"""
+    if request.param == "numba":
+        pytest.importorskip("numba")
+    monkeypatch.setattr(artifact_analyzer, "HAS_NUMBA", request.param == "numba")
+    return request.param
+
+
+def test_numba_kernel_is_used():
+    pytest.importorskip("numba")
+    assert artifact_analyzer.HAS_NUMBA
+
+    mask = make_mask()
+    mask.flags.writeable = False
+    counts = artifact_analyzer.count_classes(mask)
+    np.testing.assert_array_equal(counts[:8], np.bincount(mask.ravel(), minlength=8))
+
+
+def test_analyze_mask_png(tmp_path, counting):
+    mask_path = str(tmp_path / "slide_mask.png")
+    Image.fromarray(make_mask()).save(mask_path)
+
+    assert artifact_analyzer.GrandQCAnalyzer().analyze_mask(mask_path) == EXPECTED
+
+
+def test_analyze_mask_npy(tmp_path, counting):
+    mask_path = str(tmp_path / "slide_mask.png")
+    # The PNG is all background, so the result can only come from the .npy sibling
+    Image.fromarray(np.full((10, 20), 7, dtype=np.uint8)).save(mask_path)
+    np.save(str(tmp_path / "slide_mask.npy"), make_mask())
+
+    assert artifact_analyzer.GrandQCAnalyzer().analyze_mask(mask_path) == EXPECTED
+
+
+def test_analyze_mask_stale_npy(tmp_path, counting):
+    mask_path = str(tmp_path / "slide_mask.png")
+    npy_path = str(tmp_path / "slide_mask.npy")
+    np.save(npy_path, np.full((10, 20), 7, dtype=np.uint8))
+    Image.fromarray(make_mask()).save(mask_path)
+    # The PNG was rewritten after the .npy, so the .npy must be ignored
+    os.utime(npy_path, (0, 0))
+
+    assert artifact_analyzer.GrandQCAnalyzer().analyze_mask(mask_path) == EXPECTED
+
+
+@pytest.mark.parametrize("use_threads", [False, True])
+def test_analyze_directory(tmp_path, use_threads, counting):
+    for name in ("a", "b", "c"):
+        Image.fromarray(make_mask()).save(str(tmp_path / f"{name}_mask.png"))
+
+    df = artifact_analyzer.GrandQCAnalyzer().analyze_directory(
+        str(tmp_path), max_workers=2, use_threads=use_threads)
+
+    assert sorted(df["Slide"]) == ["a", "b", "c"]
+    for class_name, percentage in EXPECTED.items():
+        np.testing.assert_allclose(df[class_name], percentage, rtol=1e-6)
+
+
+def test_generate_report_csv(tmp_path, counting):
+    mask_dir = tmp_path / "masks"
+    mask_dir.mkdir()
+    for name in ("a", "b"):
+        Image.fromarray(make_mask()).save(str(mask_dir / f"{name}_mask.png"))
+    analyzer = artifact_analyzer.GrandQCAnalyzer()
+    df = analyzer.analyze_directory(str(mask_dir), use_threads=True)
+
+    output_dir = tmp_path / "report"
+    analyzer.generate_report(df, str(output_dir), as_csv=True)
+
+    assert (output_dir / "artifact_analysis.csv").exists()
+    assert (output_dir / "summary_statistics.csv").exists()
+    assert (output_dir / "artifact_distribution.png").exists()
+
+
+def test_generate_report_empty_directory(tmp_path, counting):
+    analyzer = artifact_analyzer.GrandQCAnalyzer()
+    df = analyzer.analyze_directory(str(tmp_path), use_threads=True)
+    assert len(df) == 0
+
+    output_dir = tmp_path / "report"
+    analyzer.generate_report(df, str(output_dir), as_csv=True)
+
+    assert (output_dir / "artifact_analysis.csv").exists()
+    assert (output_dir / "summary_statistics.csv").exists()
+    assert not (output_dir / "artifact_distribution.png").exists()
+
+
+def test_generate_report_single_slide(tmp_path, counting):
+    pd = pytest.importorskip("pandas")
+    mask_dir = tmp_path / "masks"
+    mask_dir.mkdir()
+    Image.fromarray(make_mask()).save(str(mask_dir / "a_mask.png"))
+    analyzer = artifact_analyzer.GrandQCAnalyzer()
+    df = analyzer.analyze_directory(str(mask_dir), use_threads=True)
+
+    output_dir = tmp_path / "report"
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        analyzer.generate_report(df, str(output_dir), as_csv=True)
+
+    summary = pd.read_csv(str(output_dir / "summary_statistics.csv"), index_col=0)
+    assert summary.loc["std"].isna().all()
+    assert summary.loc["mean", "Normal Tissue"] == pytest.approx(40.0)
+
+
+def test_generate_report_parquet(tmp_path, counting):
+    pd = pytest.importorskip("pandas")
+    pytest.importorskip("pyarrow")
+    mask_dir = tmp_path / "masks"
+    mask_dir.mkdir()
+    for name in ("a", "b"):
+        Image.fromarray(make_mask()).save(str(mask_dir / f"{name}_mask.png"))
+    analyzer = artifact_analyzer.GrandQCAnalyzer()
+    df = analyzer.analyze_directory(str(mask_dir), use_threads=True)
+
+    output_dir = tmp_path / "report"
+    analyzer.generate_report(df, str(output_dir))
+
+    result = pd.read_parquet(str(output_dir / "artifact_analysis.parquet"))
+    pd.testing.assert_frame_equal(result, df)
+    summary = pd.read_parquet(str(output_dir / "summary_statistics.parquet"))
+    assert summary.loc["mean", "Pen Marking"] == pytest.approx(20.0)
+    assert not (output_dir / "artifact_analysis.csv").exists()
+
+
+def test_generate_report_without_pyarrow(tmp_path, counting, monkeypatch):
+    mask_dir = tmp_path / "masks"
+    mask_dir.mkdir()
+    Image.fromarray(make_mask()).save(str(mask_dir / "a_mask.png"))
+    analyzer = artifact_analyzer.GrandQCAnalyzer()
+    df = analyzer.analyze_directory(str(mask_dir), use_threads=True)
+
+    find_spec = importlib.util.find_spec
+    monkeypatch.setattr(importlib.util, "find_spec",
+                        lambda name, *args: None if name == "pyarrow" else find_spec(name, *args))
+    output_dir = tmp_path / "report"
+    analyzer.generate_report(df, str(output_dir))
+
+    assert (output_dir / "artifact_analysis.csv").exists()
+    assert (output_dir / "summary_statistics.csv").exists()
+    assert not (output_dir / "artifact_analysis.parquet").exists()
@@ -1,16 +1,39 @@
 import os
 import sys
 import time
+import signal
+import sqlite3
 import logging
-import subprocess
+import threading
+from contextlib import closing
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 
+# Seconds to wait after the last new slide before processing the batch
+BATCH_DELAY = 5
+
+# inotify (Linux) emits close-after-write events, other platforms poll the file size
+CLOSE_EVENTS = sys.platform.startswith('linux')
+POLL_INTERVAL = 0.1
+MAX_POLL_INTERVAL = 2.0
+STABLE_SAMPLES = 3
+
 class SVSHandler(FileSystemEventHandler):
-    def __init__(self, input_dir, output_dir):
+    def __init__(self, input_dir, output_dir, batch_delay=BATCH_DELAY):
         self.input_dir = input_dir
         self.output_dir = output_dir
-        self.processed_files = set()
+        self.batch_delay = batch_delay
+        
+        # Slides processed in earlier runs are persisted next to the log
+        self.db_path = os.path.join(output_dir, 'processed.sqlite')
+        self.processed_files = self._load_processed()
+        
+        # Slides waiting for the next batch run
+        self.pending = set()
+        self.pending_lock = threading.Lock()
+        self.flush_timer = None
+        # Only one batch runs the pipeline at a time
+        self.run_lock = threading.Lock()
         
         # Initialize logging
         logging.basicConfig(
@@ -22,62 +45,213 @@ class SVSHandler(FileSystemEventHandler):
             ]
         )
         self.logger = logging.getLogger(__name__)
+        self.logger.info(f"Loaded {len(self.processed_files)} previously processed file(s)")
+
+        # Import the pipeline once, so torch and the models are loaded a single time.
+        # The scripts are taken from the working directory, as when they were run directly.
+        if os.getcwd() not in sys.path:
+            sys.path.insert(0, os.getcwd())
+        import wsi_tis_detect
+        import main as artifact_main
+        self.tis_detect = wsi_tis_detect
+        self.artifact_detect = artifact_main
+
+    def _load_processed(self):
+        """
+        Create the processed-files database if needed and load its paths
+        
+        Returns:
+            set: Paths of slides that were already processed
+        """
+        with closing(sqlite3.connect(self.db_path)) as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            with conn:
+                conn.execute('CREATE TABLE IF NOT EXISTS done(path TEXT PRIMARY KEY, ts REAL)')
+            return {row[0] for row in conn.execute('SELECT path FROM done')}
+
+    def _mark_processed(self, file_paths):
+        """
+        Record successfully processed slides in memory and in the database
+        
+        Args:
+            file_paths (list): Paths of the processed slides
+        """
+        now = time.time()
+        with closing(sqlite3.connect(self.db_path)) as conn, conn:
+            conn.executemany('INSERT OR IGNORE INTO done(path, ts) VALUES (?, ?)',
+                             [(file_path, now) for file_path in file_paths])
+        self.processed_files.update(file_paths)
+
+    def _new_slide_path(self, event, file_path):
+        """
+        Return file_path if it is a new .svs file in the watched folder, else None
+        """
+        if event.is_directory or not file_path.lower().endswith('.svs'):
+            return None
+        if os.path.dirname(file_path) != self.input_dir:
+            return None
+
+        # Check if file was already processed
+        if file_path in self.processed_files:
+            self.logger.info(f"File {os.path.basename(file_path)} was already processed. Skipping...")
+            return None
+        return file_path
+
+    def on_closed(self, event):
+        # inotify reports IN_CLOSE_WRITE once the writer is done with the file
+        file_path = self._new_slide_path(event, event.src_path)
+        if file_path is None:
+            return
+
+        self.logger.info(f"New .svs file written: {os.path.basename(file_path)}")
+        self.schedule(file_path)
+
+    def on_moved(self, event):
+        # A slide renamed into place (e.g. from a temp file) is already complete
+        file_path = self._new_slide_path(event, event.dest_path)
+        if file_path is None:
+            return
+
+        self.logger.info(f"New .svs file moved in: {os.path.basename(file_path)}")
+        self.schedule(file_path)
 
     def on_created(self, event):
-        if event.is_directory:
+        file_path = self._new_slide_path(event, event.src_path)
+        if file_path is None:
             return
+
+        file_name = os.path.basename(file_path)
+        self.logger.info(f"New .svs file detected: {file_name}")
+        if CLOSE_EVENTS:
+            # A slide moved in from another folder gets no close event. Schedule it
+            # now; _flush defers it while it is still being written, and on_closed
+            # restarts the batch timer when a writer finishes.
+            self.schedule(file_path)
+        elif self._wait_until_written(file_path):
+            self.schedule(file_path)
+
+    def _wait_until_written(self, file_path):
+        """
+        Poll the file size until it has been stable for STABLE_SAMPLES checks
         
-        if event.src_path.lower().endswith('.svs'):
-            file_path = event.src_path
-            file_name = os.path.basename(file_path)
+        Args:
+            file_path (str): Path of the file being written
             
-            # Check if file was already processed
-            if file_path in self.processed_files:
-                self.logger.info(f"File {file_name} was already processed. Skipping...")
-                return
-                
-            self.logger.info(f"New .svs file detected: {file_name}")
-            
-            # Wait for file to be completely written
-            file_size = -1
-            while True:
-                try:
-                    current_size = os.path.getsize(file_path)
-                    if current_size == file_size:
-                        break
-                    file_size = current_size
-                    time.sleep(1)  # Wait 1 second before checking again
-                except OSError:
-                    self.logger.error(f"Error accessing file {file_name}. File may be in use.")
-                    return
+        Returns:
+            bool: True once the file is complete, False if it cannot be accessed
+        """
+        delay = POLL_INTERVAL
+        file_size = -1
+        stable = 0
+        while stable < STABLE_SAMPLES:
+            try:
+                current_size = os.path.getsize(file_path)
+            except OSError:
+                self.logger.error(f"Error accessing file {os.path.basename(file_path)}. File may be in use.")
+                return False
+
+            if current_size == file_size:
+                stable += 1
+            else:
+                stable = 0
+                file_size = current_size
+            time.sleep(delay)
+            delay = min(delay * 2, MAX_POLL_INTERVAL)
+        return True
+
+    def schedule(self, file_path):
+        """
+        Add a slide to the pending batch and restart the debounce timer
+        
+        Args:
+            file_path (str): Path of the slide to process
+        """
+        with self.pending_lock:
+            self.pending.add(file_path)
+            if self.flush_timer is not None:
+                self.flush_timer.cancel()
+            # Not a daemon, so a running batch is finished before the process exits
+            self.flush_timer = threading.Timer(self.batch_delay, self._flush)
+            self.flush_timer.start()
+
+    def close(self):
+        """
+        Process the slides still waiting for a batch and wait for a running batch
+        """
+        with self.pending_lock:
+            if self.flush_timer is not None:
+                self.flush_timer.cancel()
+                self.flush_timer = None
+            remaining = len(self.pending)
+        if remaining:
+            self.logger.info(f"Processing {remaining} pending slide(s) before shutdown")
+        self._flush(final=True)
+        # A batch started by the timer may still be running
+        with self.run_lock:
+            pass
+
+    def _flush(self, final=False):
+        """
+        Run tissue and artifact detection once for all pending slides
+        
+        Slides modified within the last batch_delay seconds may still be being written
+        and are put back for the next batch. On the final flush they are polled until
+        their size is stable instead.
+        
+        Args:
+            final (bool): Last flush before shutdown, do not reschedule slides
+        """
+        with self.pending_lock:
+            pending = sorted(self.pending)
+            self.pending.clear()
+            if self.flush_timer is threading.current_thread():
+                self.flush_timer = None
 
+        batch = []
+        now = time.time()
+        for file_path in pending:
+            try:
+                modified = os.path.getmtime(file_path)
+            except OSError:
+                self.logger.error(f"Error accessing file {os.path.basename(file_path)}. Skipping...")
+                continue
+            if now - modified >= self.batch_delay:
+                batch.append(file_path)
+            elif final:
+                # No later batch will pick it up, so wait for the write to settle
+                if self._wait_until_written(file_path):
+                    batch.append(file_path)
+            else:
+                self.schedule(file_path)
+        if not batch:
+            return
+
+        file_names = [os.path.basename(file_path) for file_path in batch]
+        with self.run_lock:
+            self.logger.info(f"Processing batch of {len(batch)} slide(s): {', '.join(file_names)}")
             try:
                 # Run tissue detection first
-                self.logger.info(f"Running tissue detection on {file_name}")
-                subprocess_env = os.environ.copy()
-                subprocess.run([
-                    "python", 
-                    "wsi_tis_detect.py",
-                    "--slide_folder", self.input_dir,
-                    "--output_dir", self.output_dir
-                ], env=subprocess_env, check=True)
-
-                # Then run artifact detection
-                self.logger.info(f"Running artifact detection on {file_name}")
-                subprocess.run([
-                    "python", 
-                    "main.py",
-                    "--slide_folder", self.input_dir,
-                    "--output_dir", self.output_dir
-                ], env=subprocess_env, check=True)
-
-                self.processed_files.add(file_path)
-                self.logger.info(f"Successfully processed {file_name}")
+                self.logger.info("Running tissue detection on batch")
+                detected = self.tis_detect.run(self.input_dir, self.output_dir, slides=file_names)
+
+                # Then run artifact detection on the slides with a tissue mask
+                succeeded = set()
+                if detected:
+                    self.logger.info("Running artifact detection on batch")
+                    succeeded.update(self.artifact_detect.run(self.input_dir, self.output_dir, slides=detected))
+
+                # Only record slides that went through both steps, failed ones are retried
+                # when they show up again
+                self._mark_processed([file_path for file_path, file_name in zip(batch, file_names)
+                                      if file_name in succeeded])
+                failed = [file_name for file_name in file_names if file_name not in succeeded]
+                if succeeded:
+                    self.logger.info(f"Successfully processed {', '.join(sorted(succeeded))}")
+                if failed:
+                    self.logger.error(f"Error processing {', '.join(failed)}")
                 
-            except subprocess.CalledProcessError as e:
-                self.logger.error(f"Error processing {file_name}: {str(e)}")
             except Exception as e:
-                self.logger.error(f"Unexpected error processing {file_name}: {str(e)}")
+                self.logger.error(f"Error processing batch: {str(e)}")
 
 def start_watching(input_dir, output_dir):
     """
@@ -100,13 +274,15 @@ def start_watching(input_dir, output_dir):
     print(f"Output will be saved to {output_dir}")
     print("Press Ctrl+C to stop")
     
-    try:
-        while True:
-            time.sleep(1)
-    except KeyboardInterrupt:
-        observer.stop()
+    def stop_watching(signum, frame):
         print("\nStopping watchdog...")
+        observer.stop()
+
+    # Block in observer.join() until a signal handler stops the observer
+    signal.signal(signal.SIGINT, stop_watching)
+    signal.signal(signal.SIGTERM, stop_watching)
     observer.join()
+    event_handler.close()
 
 if __name__ == "__main__":
     if len(sys.argv) != 3: